@@ -4,16 +4,74 @@ Directly inject canonical relationships into knowledge graph
 Since artists like Aerosmith aren't in the current KG, we need to add them
 """
 
+import argparse
+import io
 import json
+import os
 import boto3
+from boto3.s3.transfer import TransferConfig
+import ijson
+import orjson
 from datetime import datetime
 import logging
+from pathlib import Path
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def inject_canonical_relationships():
+# Multipart settings for the KG upload - parts go up concurrently once the body is large
+KG_TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=128 * 1024 ** 2,
+    multipart_chunksize=16 * 1024 ** 2,
+    max_concurrency=10
+)
+
+def _base_relationship(artist_name, slug, canonical_urls, source_count, metadata_template):
+    """Build the base canonical_info relationship for an artist"""
+    return {
+        'id': f"canonical_{slug}_base",
+        'primary_artist': artist_name,
+        'secondary_artist': 'Canonical References',
+        'relationship_type': 'canonical_info',
+        'content': f"{artist_name} canonical reference sources available",
+        'source': 'Canonical Recovery',
+        'url': '',
+        'confidence': 1.0,
+        'canonical_urls': canonical_urls,
+        'metadata': {
+            **metadata_template,
+            'content_type': 'canonical_reference',
+            'source_count': source_count
+        }
+    }
+
+def _source_relationship(artist_name, slug, i, source_attr, parent_id, metadata_template):
+    """Build a canonical_source relationship for one source attribution
+    
+    canonical_urls live only on the artist's base relationship; join on canonical_parent_id.
+    """
+    content = source_attr['content']
+    return {
+        'id': f"canonical_{slug}_{source_attr['source'].lower()}_{i}",
+        'primary_artist': artist_name,
+        'secondary_artist': source_attr['source'],
+        'relationship_type': 'canonical_source',
+        'content': content if len(content) <= 500 else content[:500] + '...',
+        'source': source_attr['source'],
+        'url': source_attr.get('url', ''),
+        'confidence': 1.0,
+        'canonical_parent_id': parent_id,
+        'metadata': {
+            **metadata_template,
+            'content_type': source_attr.get('content_type', 'reference'),
+            'title': source_attr.get('title', ''),
+            'source_metadata': source_attr.get('metadata', {})
+        }
+    }
+
+def inject_canonical_relationships(keep_local=False):
     """Inject canonical data as new relationships into knowledge graph"""
+    batch_ts = datetime.utcnow().isoformat()
     
     # Load current knowledge graph
     logger.info("📊 Loading current knowledge graph...")
@@ -28,55 +86,45 @@ def inject_canonical_relationships():
         Bucket='ut-processed-content', 
         Key='02-processed-content/2025-08-31/canonical-recovery-20250831_014539.json'
     )
-    canonical_data = json.loads(obj['Body'].read().decode('utf-8'))
+    # Stream entities straight off the response body rather than loading the whole file
+    entities_iter = ijson.items(obj['Body'], 'entities.item', use_float=True)
     
     # Create canonical relationships
     new_relationships = []
+    canonical_artists_added = 0
+    source_set, url_set = set(), set()
     
-    for entity in canonical_data['entities']:
+    for entity in entities_iter:
+        canonical_artists_added += 1
         artist_name = entity['entity_name']
         logger.info(f"🎯 Processing {artist_name}...")
         
+        # Loop-invariant per artist
+        slug = artist_name.lower().replace(' ', '_')
+        # Fields shared by every relationship's metadata for this artist
+        metadata_template = {'recovery_timestamp': datetime.utcnow().isoformat()}
+        canonical_urls = entity.get('canonical_urls', {})
+        source_attributions = entity.get('source_attribution', [])
+        
         # Create base canonical relationship for the artist
-        base_rel = {
-            'id': f"canonical_{artist_name.lower().replace(' ', '_')}_base",
-            'primary_artist': artist_name,
-            'secondary_artist': 'Canonical References',
-            'relationship_type': 'canonical_info',
-            'content': f"{artist_name} canonical reference sources available",
-            'source': 'Canonical Recovery',
-            'url': '',
-            'confidence': 1.0,
-            'canonical_urls': entity.get('canonical_urls', {}),
-            'metadata': {
-                'content_type': 'canonical_reference',
-                'recovery_timestamp': datetime.utcnow().isoformat(),
-                'source_count': len(entity.get('source_attribution', []))
-            }
-        }
-        new_relationships.append(base_rel)
+        base_rel = _base_relationship(artist_name, slug, canonical_urls, len(source_attributions), metadata_template)
         
         # Create relationship for each source attribution
-        for i, source_attr in enumerate(entity.get('source_attribution', [])):
-            source_rel = {
-                'id': f"canonical_{artist_name.lower().replace(' ', '_')}_{source_attr['source'].lower()}_{i}",
-                'primary_artist': artist_name,
-                'secondary_artist': source_attr['source'],
-                'relationship_type': 'canonical_source',
-                'content': source_attr['content'][:500] + ('...' if len(source_attr['content']) > 500 else ''),
-                'source': source_attr['source'],
-                'url': source_attr.get('url', ''),
-                'confidence': 1.0,
-                'canonical_urls': entity.get('canonical_urls', {}),
-                'metadata': {
-                    'content_type': source_attr.get('content_type', 'reference'),
-                    'title': source_attr.get('title', ''),
-                    'source_metadata': source_attr.get('metadata', {}),
-                    'recovery_timestamp': datetime.utcnow().isoformat()
-                }
-            }
-            new_relationships.append(source_rel)
-            logger.info(f"  ➕ Added {source_attr['source']} relationship")
+        source_rels = [
+            _source_relationship(artist_name, slug, i, source_attr, base_rel['id'], metadata_template)
+            for i, source_attr in enumerate(source_attributions)
+        ]
+        
+        # Entities are streamed, so the total can't be pre-sized; extend with each
+        # artist's exactly-sized block in one call instead
+        new_relationships.extend([base_rel, *source_rels])
+        source_set.add(base_rel['source'])
+        source_set.update([rel['source'] for rel in source_rels])
+        # canonical_urls are carried by the base relationship only
+        url_set.update(canonical_urls.values())
+        
+        if source_rels:
+            logger.info(f"  ➕ Added {', '.join(rel['source'] for rel in source_rels)} relationships")
     
     # Add to knowledge graph
     if 'relationships' not in kg:
@@ -92,33 +140,34 @@ def inject_canonical_relationships():
     
     kg['enhancement_info']['canonical_injection'] = {
         'injected_relationships': len(new_relationships),
-        'canonical_artists_added': len(canonical_data['entities']),
-        'canonical_sources': list(set([rel['source'] for rel in new_relationships])),
-        'canonical_urls': list(set([url for rel in new_relationships 
-                                   for url in rel.get('canonical_urls', {}).values()])),
-        'injection_timestamp': datetime.utcnow().isoformat()
+        'canonical_artists_added': canonical_artists_added,
+        'canonical_sources': list(source_set),
+        'canonical_urls': list(url_set),
+        'injection_timestamp': batch_ts
     }
     
     logger.info(f"✅ Original relationships: {original_count}")
     logger.info(f"➕ Injected relationships: {len(new_relationships)}")
     logger.info(f"📊 Total relationships: {kg['total_relationships']}")
     
-    # Save enhanced knowledge graph
-    timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
-    enhanced_file = f'/tmp/kg_with_canonical_injection_{timestamp}.json'
+    # Serialize once and reuse the same buffer for the local copy and the S3 upload
+    body = orjson.dumps(kg, default=str)
     
-    with open(enhanced_file, 'w') as f:
-        json.dump(kg, f, indent=2, default=str)
-    
-    logger.info(f"💾 Enhanced knowledge graph saved: {enhanced_file}")
+    # Local copy is only a debug artifact - opt in with --keep-local or KEEP_LOCAL_KG
+    if keep_local or os.environ.get('KEEP_LOCAL_KG', '').lower() in ('1', 'true', 'yes'):
+        timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
+        enhanced_file = f'/tmp/kg_with_canonical_injection_{timestamp}.json'
+        Path(enhanced_file).write_bytes(body)
+        logger.info(f"💾 Enhanced knowledge graph saved: {enhanced_file}")
     
     # Upload to S3 - update the main path the vector store uses
     main_s3_key = "enhanced-knowledge-graph/2025/08/31/complete_knowledge_graph_main.json"
-    s3_client.put_object(
-        Bucket='ut-processed-content',
-        Key=main_s3_key,
-        Body=json.dumps(kg, indent=2, default=str).encode('utf-8'),
-        ContentType='application/json'
+    s3_client.upload_fileobj(
+        io.BytesIO(body),
+        'ut-processed-content',
+        main_s3_key,
+        Config=KG_TRANSFER_CONFIG,
+        ExtraArgs={'ContentType': 'application/json'}
     )
     
     logger.info(f"📤 Updated main KG path: s3://ut-processed-content/{main_s3_key}")
@@ -133,7 +182,12 @@ def inject_canonical_relationships():
     }
 
 if __name__ == '__main__':
-    result = inject_canonical_relationships()
+    parser = argparse.ArgumentParser(description='Inject canonical relationships into the knowledge graph')
+    parser.add_argument('--keep-local', action='store_true',
+                       help='Also save the enhanced knowledge graph under /tmp')
+    args = parser.parse_args()
+    
+    result = inject_canonical_relationships(keep_local=args.keep_local)
     
     print("\n🎉 Canonical Relationships Injection Complete!")
     print(f"📊 Original relationships: {result['original_relationships']}")
@@ -9,19 +9,33 @@ Usage:
     python recover-canonical-data.py --update-vector-store
 """
 
+import asyncio
 import json
+import aiofiles
 import boto3
+from boto3.s3.transfer import TransferConfig
+import ijson
+import orjson
 import os
+import tempfile
 import logging
 from datetime import datetime
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Iterator, Optional, Tuple
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import argparse
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from functools import partial
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Keys _process_raw_wikipedia reads; large dumps are parsed selectively down to these
+RAW_WIKIPEDIA_KEYS = frozenset(['url', 'title', 'content', 'summary', 'page_id', 'infobox', 'discography'])
+LARGE_WIKI_FILE_BYTES = 32 * 1024 ** 2
+
 class CanonicalDataRecovery:
     """Recover and deploy canonical Wikipedia/MusicBrainz data"""
     
@@ -34,79 +48,99 @@ class CanonicalDataRecovery:
         ]
         self.vector_store_url = "http://ut-api-alb-470552730.us-east-1.elb.amazonaws.com"
         
-    def discover_local_canonical_data(self) -> List[Dict[str, Any]]:
+        # Pooled session so health check and reload reuse the same connection
+        self._http = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=10,
+            pool_maxsize=10,
+            max_retries=Retry(total=3, backoff_factor=0.2)
+        )
+        self._http.mount('http://', adapter)
+        self._http.mount('https://', adapter)
+        
+        # One timestamp per run so every artifact (entities, S3 key, report) agrees
+        self._run_started = datetime.utcnow()
+        self._run_iso = self._run_started.isoformat()
+        self._run_stamp = self._run_started.strftime('%Y%m%d_%H%M%S')
+        
+    async def discover_local_canonical_data(self) -> List[Dict[str, Any]]:
         """Find all canonical data in local directories"""
         logger.info("🔍 Discovering local canonical data...")
         
-        canonical_data = []
+        candidates = []
         
         # Check scraped content directory
         scraped_path = Path(self.local_data_paths[0])
         if scraped_path.exists():
-            for artist_dir in scraped_path.iterdir():
-                if artist_dir.is_dir():
-                    canonical_dir = artist_dir / 'canonical'
-                    if canonical_dir.exists():
-                        merged_file = canonical_dir / 'merged.json'
-                        if merged_file.exists():
-                            try:
-                                with open(merged_file, 'r') as f:
-                                    data = json.load(f)
-                                    canonical_data.append({
-                                        'artist': artist_dir.name,
-                                        'source_file': str(merged_file),
-                                        'data': data,
-                                        'type': 'scraped_canonical'
-                                    })
-                                    logger.info(f"✅ Found canonical data for {artist_dir.name}")
-                            except Exception as e:
-                                logger.error(f"Error reading {merged_file}: {e}")
+            for merged_file in scraped_path.glob('*/canonical/merged.json'):
+                candidates.append((merged_file, merged_file.parent.parent.name, 'scraped_canonical'))
         
         # Check raw Wikipedia data
         wiki_path = Path(self.local_data_paths[1]) / 'wikipedia'
         if wiki_path.exists():
             for wiki_file in wiki_path.glob('*.json'):
-                try:
-                    with open(wiki_file, 'r') as f:
-                        data = json.load(f)
-                        canonical_data.append({
-                            'artist': wiki_file.stem.replace('_', ' ').title(),
-                            'source_file': str(wiki_file),
-                            'data': data,
-                            'type': 'raw_wikipedia'
-                        })
-                        logger.info(f"✅ Found Wikipedia data for {wiki_file.stem}")
-                except Exception as e:
-                    logger.error(f"Error reading {wiki_file}: {e}")
+                candidates.append((wiki_file, wiki_file.stem.replace('_', ' ').title(), 'raw_wikipedia'))
+        
+        # Keep all reads in flight at once; gather preserves candidate order
+        results = await asyncio.gather(*[self._load_canonical_file(*c) for c in candidates])
+        
+        canonical_data = [item for item in results if item]
         
         logger.info(f"📊 Total canonical sources found: {len(canonical_data)}")
         return canonical_data
     
+    async def _load_canonical_file(self, path: Path, artist: str, data_type: str) -> Optional[Dict[str, Any]]:
+        """Read a single local canonical file"""
+        try:
+            async with aiofiles.open(path, 'rb') as f:
+                if data_type == 'raw_wikipedia' and path.stat().st_size > LARGE_WIKI_FILE_BYTES:
+                    # Walk top-level keys one at a time so the full document is never held at once
+                    data = {key: value async for key, value in ijson.kvitems_async(f, '', use_float=True)
+                            if key in RAW_WIKIPEDIA_KEYS}
+                else:
+                    data = orjson.loads(await f.read())
+        except Exception as e:
+            logger.error(f"Error reading {path}: {e}")
+            return None
+        
+        if data_type == 'scraped_canonical':
+            logger.info(f"✅ Found canonical data for {artist}")
+        else:
+            logger.info(f"✅ Found Wikipedia data for {path.stem}")
+        
+        return {
+            'artist': artist,
+            'source_file': str(path),
+            'data': data,
+            'type': data_type
+        }
+    
     def process_canonical_data(self, canonical_data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Process canonical data into standardized format"""
         logger.info("⚙️  Processing canonical data...")
         
-        processed_entities = []
-        
-        for item in canonical_data:
-            try:
-                if item['type'] == 'scraped_canonical':
-                    entity = self._process_scraped_canonical(item)
-                elif item['type'] == 'raw_wikipedia':
-                    entity = self._process_raw_wikipedia(item)
-                else:
-                    continue
-                    
-                if entity:
-                    processed_entities.append(entity)
-                    
-            except Exception as e:
-                logger.error(f"Error processing {item['artist']}: {e}")
+        # Items are independent CPU-bound reshapes, so spread them across cores
+        dispatch = partial(self._dispatch, processing_date=self._run_iso)
+        with ProcessPoolExecutor() as executor:
+            processed_entities = [entity for entity in executor.map(dispatch, canonical_data, chunksize=8) if entity]
         
         logger.info(f"✅ Processed {len(processed_entities)} canonical entities")
         return processed_entities
     
-    def _process_scraped_canonical(self, item: Dict[str, Any]) -> Dict[str, Any]:
+    @staticmethod
+    def _dispatch(item: Dict[str, Any], processing_date: str) -> Optional[Dict[str, Any]]:
+        """Route a discovered item to its processor (runs in a worker process)"""
+        try:
+            if item['type'] == 'scraped_canonical':
+                return CanonicalDataRecovery._process_scraped_canonical(item, processing_date)
+            elif item['type'] == 'raw_wikipedia':
+                return CanonicalDataRecovery._process_raw_wikipedia(item, processing_date)
+        except Exception as e:
+            logger.error(f"Error processing {item['artist']}: {e}")
+        return None
+    
+    @staticmethod
+    def _process_scraped_canonical(item: Dict[str, Any], processing_date: str) -> Dict[str, Any]:
         """Process scraped canonical data format"""
         data = item['data']
         artist_name = item['artist']
@@ -118,7 +152,7 @@ class CanonicalDataRecovery:
             'source_attribution': [],
             'canonical_urls': {},
             'metadata': {
-                'processing_date': datetime.utcnow().isoformat(),
+                'processing_date': processing_date,
                 'source_type': 'canonical_recovery',
                 'recovery_source': item['source_file']
             }
@@ -186,7 +220,8 @@ class CanonicalDataRecovery:
         
         return entity
     
-    def _process_raw_wikipedia(self, item: Dict[str, Any]) -> Dict[str, Any]:
+    @staticmethod
+    def _process_raw_wikipedia(item: Dict[str, Any], processing_date: str) -> Dict[str, Any]:
         """Process raw Wikipedia data format"""
         data = item['data']
         artist_name = item['artist']
@@ -211,7 +246,7 @@ class CanonicalDataRecovery:
                 'wikipedia': data.get('url', '')
             },
             'metadata': {
-                'processing_date': datetime.utcnow().isoformat(),
+                'processing_date': processing_date,
                 'source_type': 'wikipedia_recovery',
                 'recovery_source': item['source_file']
             }
@@ -223,24 +258,34 @@ class CanonicalDataRecovery:
         """Upload processed canonical data to S3"""
         logger.info("📤 Uploading canonical data to S3...")
         
-        timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
-        s3_key = f"02-processed-content/{datetime.utcnow().strftime('%Y-%m-%d')}/canonical-recovery-{timestamp}.json"
+        timestamp = self._run_stamp
+        s3_key = f"02-processed-content/{self._run_started.strftime('%Y-%m-%d')}/canonical-recovery-{timestamp}.json"
         
-        upload_data = {
+        header = {
             'recovery_timestamp': timestamp,
             'entities_count': len(processed_entities),
             'canonical_sources': list(set([url for entity in processed_entities 
-                                         for url in entity['canonical_urls'].values()])),
-            'entities': processed_entities
+                                         for url in entity['canonical_urls'].values()]))
         }
         
         try:
-            self.s3_client.put_object(
-                Bucket=self.bucket_name,
-                Key=s3_key,
-                Body=json.dumps(upload_data, indent=2, default=str).encode('utf-8'),
-                ContentType='application/json'
-            )
+            # Encode entities one at a time into a spooled buffer instead of building the whole body
+            with tempfile.SpooledTemporaryFile(max_size=64 * 1024 ** 2) as spool:
+                spool.write(orjson.dumps(header, default=str)[:-1] + b',"entities":[')
+                for i, entity in enumerate(processed_entities):
+                    if i:
+                        spool.write(b',')
+                    spool.write(orjson.dumps(entity, default=str))
+                spool.write(b']}')
+                spool.seek(0)
+                
+                self.s3_client.upload_fileobj(
+                    spool,
+                    self.bucket_name,
+                    s3_key,
+                    Config=TransferConfig(multipart_threshold=8 * 1024 ** 2),
+                    ExtraArgs={'ContentType': 'application/json'}
+                )
             
             logger.info(f"✅ Uploaded to S3: s3://{self.bucket_name}/{s3_key}")
             return f"s3://{self.bucket_name}/{s3_key}"
@@ -249,20 +294,49 @@ class CanonicalDataRecovery:
             logger.error(f"❌ S3 upload failed: {e}")
             raise
     
+    def _list_prefix(self, prefix: str):
+        """Yield every object key under an S3 prefix"""
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix):
+            for obj in page.get('Contents', []):
+                yield obj['Key']
+    
+    def iter_recovery_artifacts(self, prefix: str) -> Iterator[Tuple[str, Any]]:
+        """Yield (key, streaming body) for each canonical recovery file under a prefix
+        
+        Pass a single date's prefix, e.g. '02-processed-content/2025-08-31/'. Bodies are
+        returned unread so callers can stream-parse them (ijson.items(body, 'entities.item')).
+        """
+        keys = [key for key in self._list_prefix(prefix)
+                if 'canonical-recovery-' in key and key.endswith('.json')]
+        
+        # boto3 clients are thread-safe, so the shared client can serve every worker
+        with ThreadPoolExecutor(max_workers=32) as executor:
+            futures = {
+                executor.submit(self.s3_client.get_object, Bucket=self.bucket_name, Key=key): key
+                for key in keys
+            }
+            for future in as_completed(futures):
+                key = futures[future]
+                try:
+                    yield key, future.result()['Body']
+                except Exception as e:
+                    logger.error(f"Error fetching s3://{self.bucket_name}/{key}: {e}")
+    
     def update_vector_store(self, s3_path: str) -> bool:
         """Notify vector store to reload with new canonical data"""
         logger.info("🔄 Updating vector store...")
         
         try:
             # First check if vector store is accessible
-            health_response = requests.get(f"{self.vector_store_url}/health", timeout=10)
+            health_response = self._http.get(f"{self.vector_store_url}/health", timeout=10)
             if health_response.status_code != 200:
                 logger.error("❌ Vector store not accessible")
                 return False
             
             # Trigger reload (if endpoint exists)
             try:
-                reload_response = requests.post(
+                reload_response = self._http.post(
                     f"{self.vector_store_url}/reload",
                     json={"s3_path": s3_path},
                     timeout=30
@@ -272,7 +346,7 @@ class CanonicalDataRecovery:
                     return True
                 else:
                     logger.warning(f"⚠️  Reload endpoint returned {reload_response.status_code}")
-            except:
+            except requests.RequestException:
                 logger.info("ℹ️  No reload endpoint - vector store will pick up data on next restart")
             
             return True
@@ -283,7 +357,7 @@ class CanonicalDataRecovery:
     
     def save_recovery_report(self, canonical_data: List[Dict], processed_entities: List[Dict], s3_path: str) -> str:
         """Save detailed recovery report"""
-        timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
+        timestamp = self._run_stamp
         report_file = f"/tmp/canonical-recovery-report-{timestamp}.json"
         
         report = {
@@ -334,7 +408,7 @@ def main():
         print("🚀 Starting canonical data recovery process...")
         
         # Discover local data
-        canonical_data = recovery.discover_local_canonical_data()
+        canonical_data = asyncio.run(recovery.discover_local_canonical_data())
         if not canonical_data:
             print("❌ No canonical data found locally")
             return
@@ -63,6 +63,13 @@ class EntityCentricRestoration:
             'cultural_significance': 0.0
         })
         
+        # Canonical source relationships carry their URLs on the base relationship only
+        canonical_urls_by_id = {
+            rel['id']: rel['canonical_urls']
+            for rel in relationships
+            if 'id' in rel and 'canonical_urls' in rel
+        }
+        
         for rel in relationships:
             # Handle both old and new knowledge graph formats
             primary_artist = (rel.get('source_entity') or 
@@ -92,6 +99,8 @@ class EntityCentricRestoration:
                 # Add canonical URLs if available
                 if 'canonical_urls' in rel:
                     connection['canonical_urls'] = rel['canonical_urls']
+                elif rel.get('canonical_parent_id') in canonical_urls_by_id:
+                    connection['canonical_urls'] = canonical_urls_by_id[rel['canonical_parent_id']]
                 
                 entities[primary_artist]['connections'].append(connection)
             